@@ -0,0 +1,58 @@
+import os
+import multiprocessing
+
+# --- Configuración de gunicorn para producción ---
+# Las peticiones pasan casi todo el tiempo esperando a Postgres, así que cada worker atiende
+# varias a la vez (hilos con gthread, o greenlets con gevent). El total de peticiones
+# simultáneas se ajusta al límite de conexiones: workers x concurrencia <= DB_MAX_CONNECTIONS.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")  # "gthread" o "gevent"
+
+# CPUs que el proceso puede usar (en un contenedor pueden ser menos que las del host)
+if hasattr(os, "sched_getaffinity"):
+    _cpus = len(os.sched_getaffinity(0))
+else:
+    _cpus = multiprocessing.cpu_count()
+
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "10"))
+# Cada worker necesita al menos una conexión: nunca más workers que conexiones disponibles
+workers = min(int(os.environ.get("WEB_CONCURRENCY", _cpus)), DB_MAX_CONNECTIONS)
+_concurrencia = max(1, DB_MAX_CONNECTIONS // workers)
+# main.py lee DB_POOL_MAX al importarse: cada petición usa como máximo una conexión al primario
+os.environ["DB_POOL_MAX"] = str(_concurrencia)
+os.environ.setdefault("REPLICA_POOL_MAX", str(_concurrencia))
+
+if worker_class == "gevent":
+    worker_connections = _concurrencia
+else:
+    threads = _concurrencia
+
+# Con gevent la app se importa en cada worker, después de que gevent parchee la librería estándar
+preload_app = worker_class != "gevent"
+
+# Cloud Run da 10 s entre SIGTERM y SIGKILL: se deja terminar a los webhooks en curso
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+# --- Hooks ---
+def post_fork(server, worker):
+    if preload_app:
+        import wsgi
+        wsgi.reset_after_fork()
+
+def post_worker_init(worker):
+    import wsgi
+    if worker_class == "gevent":
+        wsgi.make_psycopg2_cooperative()
+    wsgi.warmup()
+
+def worker_exit(server, worker):
+    import wsgi
+    wsgi.shutdown()
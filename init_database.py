@@ -1,6 +1,8 @@
 import os
 import psycopg2
+from datetime import date
 from dotenv import load_dotenv
+from particiones import crear_historial, crear_particiones
 
 # --- Configuración de Entorno ---
 load_dotenv() # Carga las variables desde el archivo .env
@@ -38,11 +40,22 @@ CREATE TABLE cliente (
 );
 """)
 
-# 3. Tabla de Servicios (CORREGIDA)
+# 3.0 Meses archivados de una instalación anterior: las particiones separadas (DETACH) ya no
+# dependen de su tabla padre, así que se eliminan aparte junto con el registro de archivado.
+cur.execute("""
+SELECT relname FROM pg_class
+WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace
+  AND relname ~ '^(servicio|historial_estado)_[0-9]{4}_[0-9]{2}$';
+""")
+for (particion,) in cur.fetchall():
+    cur.execute(f"DROP TABLE IF EXISTS {particion} CASCADE;")
+cur.execute("DROP TABLE IF EXISTS particion_archivada CASCADE;")
+
+# 3. Tabla de Servicios (particionada por mes sobre fecha_s)
 cur.execute("""
 DROP TABLE IF EXISTS servicio CASCADE;
 CREATE TABLE servicio (
-    id_servicio SERIAL PRIMARY KEY,
+    id_servicio SERIAL,
     fecha_s DATE NOT NULL,
     hora_s TIME NOT NULL,
     tipo_s VARCHAR(100) NOT NULL,
@@ -55,10 +68,20 @@ CREATE TABLE servicio (
     CONSTRAINT fk_cerrajero FOREIGN KEY (id_cerrajero) REFERENCES cerrajero (id_cerrajero),
     CONSTRAINT ck1_servicio CHECK (estado_s IN ('pendiente', 'en proceso', 'finalizado', 'cancelado')),
     CONSTRAINT ck2_servicio CHECK (monto_pago >= 0),
-    CONSTRAINT ck3_servicio CHECK (metodo_pago IN ('efectivo', 'nequi', 'Efectivo', 'Nequi'))
-);
+    CONSTRAINT ck3_servicio CHECK (metodo_pago IN ('efectivo', 'nequi', 'Efectivo', 'Nequi')),
+    CONSTRAINT pk_servicio PRIMARY KEY (id_servicio, fecha_s)
+) PARTITION BY RANGE (fecha_s);
+CREATE INDEX idx_servicio_id ON servicio (id_servicio);
+CREATE INDEX idx_servicio_estado_fecha ON servicio (estado_s, fecha_s);
 """)
 
+# 3.1 Historial de Estados (particionada por mes sobre fecha_cambio)
+cur.execute("DROP TABLE IF EXISTS historial_estado CASCADE;")
+crear_historial(cur)
+
+# 3.2 Particiones del mes actual y los dos siguientes
+crear_particiones(cur, date.today(), 2)
+
 # 4. Tabla de Sesiones de WhatsApp (Para el Chatbot)
 cur.execute("""
 DROP TABLE IF EXISTS whatsapp_sessions CASCADE;
@@ -77,8 +100,9 @@ CREATE TABLE whatsapp_sessions (
 cur.execute("INSERT INTO cerrajero (nombre_ce, telefono_ce) VALUES (%s, %s);", ('Jose Hernández', '3111234567'))
 
 print("Base de datos inicializada correctamente.")
-print("- Se eliminaron las tablas existentes.")
-print("- Se crearon las tablas: cerrajero, cliente, servicio, whatsapp_sessions.")
+print("- Se eliminaron las tablas existentes, incluidos los meses archivados (particion_archivada).")
+print("- Se crearon las tablas: cerrajero, cliente, servicio, historial_estado, whatsapp_sessions.")
+print("- servicio e historial_estado quedaron particionadas por mes.")
 print("- Se insertó un cerrajero por defecto y se corrigió la restricción de pago.")
 
 # --- Cierre de Conexión ---
@@ -1,26 +1,206 @@
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import os
 import json
+import math
+import select
+import threading
 import psycopg2
-import psycopg2.extras
-import pytz
-from urllib.parse import urlparse
+import psycopg2.extensions
+from functools import lru_cache
 from dotenv import load_dotenv
 import logging
 from flask import Flask, request, jsonify, render_template
-from twilio.twiml.messaging_response import MessagingResponse
-from datetime import datetime
+from datetime import datetime, timedelta
+from particiones import inicio_de_mes
+from twiml import MessagingReply
+import replica
 
 # --- Configuración Inicial ---
+# Arranque en frío: psycopg2.extras y pytz se importan al primer uso (ver dict_cursor y
+# colombia_tz) y las respuestas de WhatsApp se arman sin el SDK de Twilio (ver twiml.py).
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 app = Flask(__name__)
 
 # --- Helpers de Base de Datos ---
+# Pool de conexiones al primario, uno por proceso. DB_POOL_MAX debe ser al menos el número de
+# peticiones simultáneas por worker (gunicorn.conf.py lo iguala a los hilos del worker).
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+# Una conexión que estuvo libre más de esto se comprueba con SELECT 1 antes de entregarla
+DB_POOL_PING_AFTER_SECONDS = float(os.environ.get("DB_POOL_PING_AFTER_SECONDS", "30"))
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+class PrimaryConnection(psycopg2.extensions.connection):
+    """Conexión del pool del primario; recuerda cuándo se devolvió para saber si revisarla."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.liberada_en = time.monotonic()
+
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        db_url = os.environ.get("DATABASE_URL")
+        if not db_url:
+            raise ConnectionError("La variable de entorno DATABASE_URL no está configurada.")
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = replica.ReusingConnectionPool(
+                    DB_POOL_MAX, db_url, sslmode=replica.DB_SSLMODE,
+                    connection_factory=PrimaryConnection,
+                )
+    return _db_pool
+
+def _connection_is_usable(conn):
+    if conn.closed or conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    # Una conexión libre y sana no tiene nada por leer. Si el servidor la cerró (reinicio de la
+    # base, pg_terminate_backend) el socket ya tiene el aviso FATAL o el fin de conexión.
+    if select.select([conn], [], [], 0)[0]:
+        return False
+    if time.monotonic() - conn.liberada_en < DB_POOL_PING_AFTER_SECONDS:
+        return True
+    # Pudo cortarla la red o un proxy sin avisar mientras estaba libre
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_db_connection():
-    db_url = os.environ.get("DATABASE_URL")
-    if not db_url:
-        raise ConnectionError("La variable de entorno DATABASE_URL no está configurada.")
-    return psycopg2.connect(db_url, sslmode='require')
+    """Saca una conexión del pool del primario, descartando las que ya no sirven."""
+    pool = get_db_pool()
+    # Tras un reinicio de la base todas las libres pueden estar rotas: se prueban todas
+    # y, si ninguna sirve, el pool abre una nueva
+    for _ in range(DB_POOL_MAX + 1):
+        conn = pool.getconn()
+        if _connection_is_usable(conn):
+            return conn
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("No se pudo obtener una conexión válida al primario.")
+
+def release_connection(conn):
+    """Devuelve la conexión a su pool (primario o réplica); las que se rompieron se descartan."""
+    if conn is None:
+        return
+    if isinstance(conn, replica.ReplicaConnection):
+        replica.release(conn)
+        return
+    if not conn.closed:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    conn.liberada_en = time.monotonic()
+    get_db_pool().putconn(conn, close=bool(conn.closed))
+
+def reset_db_pools():
+    """Después de un fork: olvida los pools heredados sin cerrarlos (sus sockets son del proceso padre)."""
+    global _db_pool
+    _db_pool = None
+    replica.reset()
+
+def close_db_pools():
+    """Cierra todas las conexiones del proceso (al apagar el worker)."""
+    if _db_pool is not None:
+        _db_pool.closeall()
+    replica.close()
+
+def dict_cursor(conn):
+    """Cursor que devuelve filas como diccionarios (psycopg2.extras se importa al primer uso)."""
+    import psycopg2.extras
+    return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+@lru_cache(maxsize=None)
+def colombia_tz():
+    """Zona horaria de Colombia, resuelta una sola vez por proceso."""
+    import pytz
+    return pytz.timezone('America/Bogota')
+
+def get_read_connection():
+    """Conexión para las lecturas del dashboard: la réplica si está disponible y al día,
+    salvo que este navegador haya escrito hace poco (lee sus propias escrituras del primario)."""
+    if not replica.escritura_reciente(request.cookies.get(replica.COOKIE_ULTIMA_ESCRITURA)):
+        conn = replica.get_connection()
+        if conn is not None:
+            return conn
+    return get_db_connection()
+
+def run_read_query(consultar):
+    """Ejecuta `consultar(conn)` con la conexión de lectura y devuelve su resultado.
+
+    Si la réplica falla a mitad de la consulta (OperationalError), la repite una vez
+    en el primario en vez de responder con error.
+    """
+    conn = get_read_connection()
+    try:
+        return consultar(conn)
+    except psycopg2.OperationalError as e:
+        if not isinstance(conn, replica.ReplicaConnection):
+            raise
+        app.logger.warning(f"REPLICA_READ_FAILED: {e}; se repite en el primario")
+        release_connection(conn)
+        conn = None
+        conn = get_db_connection()
+        return consultar(conn)
+    finally:
+        release_connection(conn)
+
+# --- Reporte de Arranque ---
+_first_response_logged = False
+
+def reset_startup_timer():
+    """En un worker creado con fork (preload_app), mide desde el fork y no desde el import del master."""
+    global _STARTUP_T0, _first_response_logged
+    _STARTUP_T0 = time.perf_counter()
+    _first_response_logged = False
+
+@app.after_request
+def report_first_response(response):
+    # Tiempo desde que se empezó a importar main.py (o desde el fork) hasta la primera respuesta del proceso
+    global _first_response_logged
+    if not _first_response_logged:
+        _first_response_logged = True
+        app.logger.info(f"STARTUP_FIRST_RESPONSE: {(time.perf_counter() - _STARTUP_T0) * 1000:.1f} ms "
+                        f"({request.method} {request.path})")
+    return response
+
+@app.after_request
+def mark_recent_write(response):
+    # Tras una escritura exitosa de la API, las siguientes lecturas de este navegador van al primario
+    if request.path.startswith('/api/') and request.method != 'GET' and response.status_code < 400:
+        response.set_cookie(replica.COOKIE_ULTIMA_ESCRITURA, str(time.time()),
+                            max_age=math.ceil(replica.VENTANA_LECTURA_PROPIA), httponly=True, samesite='Lax')
+    return response
+
+# Meses (año, mes) cuyas particiones ya se aseguraron en este proceso
+_particiones_aseguradas = set()
+
+def ensure_month_partition(conn, fecha):
+    """Crea, si faltan, las particiones del mes de `fecha` y del siguiente.
+
+    Debe llamarse antes de cualquier otra operación de la transacción, porque confirma
+    (commit) por su cuenta. Solo consulta la base una vez por mes y por proceso.
+    """
+    mes = (fecha.year, fecha.month)
+    if mes in _particiones_aseguradas:
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT crear_particiones_mes(%s);", (fecha,))
+    conn.commit()
+    _particiones_aseguradas.add(mes)
+
+def parse_fecha_param(nombre):
+    """Lee un parámetro de consulta con formato dd/mm/YYYY; None si no viene."""
+    valor = request.args.get(nombre)
+    return datetime.strptime(valor, '%d/%m/%Y').date() if valor else None
 
 # --- Rutas de la Interfaz Gráfica (Web) ---
 
@@ -56,10 +236,30 @@ def clave_page():
 
 @app.route("/api/servicios", methods=['GET'])
 def get_all_servicios():
-    conn = get_db_connection()
+    # Filtros ?desde=dd/mm/YYYY&hasta=dd/mm/YYYY: limitan las particiones consultadas.
+    # Sin filtros se devuelven los servicios del mes en curso y los que siguen abiertos
+    # (pendientes o en proceso) de meses anteriores; ?todos=1 devuelve todo el historial.
     try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            sql_query = """
+        desde, hasta = parse_fecha_param('desde'), parse_fecha_param('hasta')
+    except ValueError:
+        return jsonify({"error": "Formato de fecha inválido, use dd/mm/YYYY"}), 400
+
+    filtros, params = [], []
+    if not desde and not hasta and request.args.get('todos') != '1':
+        # En los meses anteriores solo se leen las filas abiertas (idx_servicio_estado_fecha)
+        filtros.append("(s.fecha_s >= %s OR s.estado_s IN ('pendiente', 'en proceso'))")
+        params.append(inicio_de_mes(datetime.now(colombia_tz()).date()))
+    if desde:
+        filtros.append("s.fecha_s >= %s")
+        params.append(desde)
+    if hasta:
+        filtros.append("s.fecha_s <= %s")
+        params.append(hasta)
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+
+    def consultar(conn):
+        with dict_cursor(conn) as cur:
+            sql_query = f"""
                 SELECT 
                     s.id_servicio, s.fecha_s AS fecha, s.hora_s AS hora,
                     s.tipo_s AS tipo, s.estado_s AS estado, s.monto_pago AS valor,
@@ -69,9 +269,10 @@ def get_all_servicios():
                 FROM servicio s
                 JOIN cliente c ON s.id_cliente = c.id_cliente
                 JOIN cerrajero ce ON s.id_cerrajero = ce.id_cerrajero
+                {where}
                 ORDER BY s.fecha_s DESC, s.hora_s DESC;
             """
-            cur.execute(sql_query)
+            cur.execute(sql_query, params)
             servicios = cur.fetchall()
             
             for servicio in servicios:
@@ -81,11 +282,12 @@ def get_all_servicios():
                     servicio['hora'] = servicio['hora'].strftime('%I:%M %p')
 
             return jsonify(servicios), 200
+
+    try:
+        return run_read_query(consultar)
     except Exception as e:
         app.logger.error(f"API_GET_SERVICIOS_ERROR: {e}")
         return jsonify({"error": "Error interno al obtener los servicios", "detalle": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/servicios/update_status', methods=['POST'])
 def update_status_from_button():
@@ -99,7 +301,8 @@ def update_status_from_button():
     conn = None
     try:
         conn = get_db_connection()
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        ensure_month_partition(conn, datetime.now(colombia_tz()).date())
+        with dict_cursor(conn) as cur:
             
             # 1. Obtener estado actual y ID del cerrajero, bloqueando la fila para la actualización
             cur.execute("SELECT estado_s, id_cerrajero FROM servicio WHERE id_servicio = %s FOR UPDATE;", (service_id,))
@@ -134,7 +337,7 @@ def update_status_from_button():
         app.logger.error(f"API_UPDATE_STATUS_ERROR: {e}")
         return jsonify({"error": "Error interno al actualizar el estado", "detalle": str(e)}), 500
     finally:
-        if conn: conn.close()
+        release_connection(conn)
         
 @app.route('/api/servicios/agregar', methods=['POST'])
 def add_new_service():
@@ -144,7 +347,9 @@ def add_new_service():
 
     conn = None
     try:
+        fecha_db = datetime.strptime(data.get('fecha'), '%d/%m/%Y').date()
         conn = get_db_connection()
+        ensure_month_partition(conn, fecha_db)
         with conn.cursor() as cur:
             cerrajero_id = None
 
@@ -173,7 +378,6 @@ def add_new_service():
                 cur.execute("INSERT INTO cliente (nombre_c, telefono_c, direccion_c, ciudad_c) VALUES (%s, %s, %s, %s) RETURNING id_cliente;", (data.get('cliente'), data.get('telefono_cliente'), data.get('direccion'), data.get('municipio')))
                 cliente_id = cur.fetchone()[0]
 
-            fecha_db = datetime.strptime(data.get('fecha'), '%d/%m/%Y').strftime('%Y-%m-%d')
             hora_db = datetime.strptime(data.get('hora'), '%I:%M %p').strftime('%H:%M:%S')
             valor_limpio = int(''.join(filter(str.isdigit, data.get('valor', '0'))))
             
@@ -190,14 +394,12 @@ def add_new_service():
         app.logger.error(f"API_ADD_SERVICE_ERROR: {e}")
         return jsonify({"error": "Error interno al guardar el servicio", "detalle": str(e)}), 500
     finally:
-        if conn: conn.close()
+        release_connection(conn)
 
 @app.route('/api/servicios/<int:service_id>', methods=['GET'])
 def get_service_by_id(service_id):
-    conn = None
-    try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+    def consultar(conn):
+        with dict_cursor(conn) as cur:
             cur.execute("""
                 SELECT s.id_servicio, s.fecha_s, s.hora_s, s.tipo_s, s.estado_s, 
                        s.monto_pago, s.metodo_pago, c.nombre_c, c.telefono_c, 
@@ -214,18 +416,22 @@ def get_service_by_id(service_id):
             servicio['fecha_s'] = servicio['fecha_s'].strftime('%d/%m/%Y')
             servicio['hora_s'] = servicio['hora_s'].strftime('%I:%M %p')
             return jsonify(servicio)
+
+    try:
+        return run_read_query(consultar)
     except Exception as e:
         app.logger.error(f"API_GET_SERVICE_ID_ERROR: {e}")
         return jsonify({"error": "Error interno al obtener el servicio", "detalle": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/servicios/<int:service_id>', methods=['PUT'])
 def update_service(service_id):
     data = request.get_json()
     conn = None
     try:
+        fecha_db = datetime.strptime(data['fecha'], '%d/%m/%Y').date()
         conn = get_db_connection()
+        # Si cambia la fecha, la fila se mueve a la partición del nuevo mes
+        ensure_month_partition(conn, fecha_db)
         with conn.cursor() as cur:
             cur.execute("SELECT id_cliente FROM cliente WHERE telefono_c = %s", (data['telefono_cliente'],))
             cliente_res = cur.fetchone()
@@ -257,7 +463,6 @@ def update_service(service_id):
                     raise ValueError(f"Cerrajero '{data['cerrajero']}' no encontrado")
                 cerrajero_id = cerrajero_res[0]
 
-            fecha_db = datetime.strptime(data['fecha'], '%d/%m/%Y').strftime('%Y-%m-%d')
             hora_db = datetime.strptime(data['hora'], '%I:%M %p').strftime('%H:%M:%S')
             valor_limpio = int(''.join(filter(str.isdigit, str(data.get('valor', '0')))))
 
@@ -276,7 +481,7 @@ def update_service(service_id):
         app.logger.error(f"API_UPDATE_SERVICE_ERROR: {e}")
         return jsonify({"error": "Error interno al actualizar", "detalle": str(e)}), 500
     finally:
-        if conn: conn.close()
+        release_connection(conn)
 
 @app.route('/api/servicios/<int:service_id>', methods=['DELETE'])
 def delete_service(service_id):
@@ -284,6 +489,8 @@ def delete_service(service_id):
     try:
         conn = get_db_connection()
         with conn.cursor() as cur:
+            # historial_estado no tiene FK hacia la tabla particionada: se borra aquí en cascada
+            cur.execute("DELETE FROM historial_estado WHERE id_servicio = %s;", (service_id,))
             cur.execute("DELETE FROM servicio WHERE id_servicio = %s;", (service_id,))
             conn.commit()
             if cur.rowcount == 0:
@@ -294,32 +501,31 @@ def delete_service(service_id):
         app.logger.error(f"API_DELETE_SERVICE_ERROR: {e}")
         return jsonify({"error": "Error interno al eliminar", "detalle": str(e)}), 500
     finally:
-        if conn: conn.close()
+        release_connection(conn)
 
 @app.route("/api/estadisticas", methods=['GET'])
 def get_estadisticas():
-    conn = None
-    try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            
-            def procesar_resultados(rows):
-                stats = {'total': 0, 'efectivo': 0, 'nequi': 0}
-                for row in rows:
-                    total_pago = float(row['total'])
-                    metodo = row['metodo_pago'].lower() 
-                    
-                    if metodo == 'efectivo':
-                        stats['efectivo'] += total_pago
-                    elif metodo == 'nequi':
-                        stats['nequi'] += total_pago
-                
-                stats['total'] = stats['efectivo'] + stats['nequi']
-                return stats
-
+    def procesar_resultados(rows):
+        stats = {'total': 0, 'efectivo': 0, 'nequi': 0}
+        for row in rows:
+            total_pago = float(row['total'])
+            metodo = row['metodo_pago'].lower() 
+
+            if metodo == 'efectivo':
+                stats['efectivo'] += total_pago
+            elif metodo == 'nequi':
+                stats['nequi'] += total_pago
+
+        stats['total'] = stats['efectivo'] + stats['nequi']
+        return stats
+
+    def consultar(conn):
+        with dict_cursor(conn) as cur:
             # --- CORRECCIÓN: Usar la zona horaria de Colombia ---
-            colombia_tz = pytz.timezone('America/Bogota')
-            today_co = datetime.now(colombia_tz).date()
+            today_co = datetime.now(colombia_tz()).date()
+
+            # Los rangos se calculan aquí como fechas simples sobre fecha_s,
+            # así el planificador descarta las particiones de otros meses.
 
             # Estadística de Hoy (usando la fecha de Colombia)
             cur.execute("""
@@ -334,18 +540,18 @@ def get_estadisticas():
             cur.execute("""
                 SELECT metodo_pago, SUM(monto_pago) as total
                 FROM servicio
-                WHERE estado_s = 'finalizado' AND fecha_s BETWEEN (%s::date - INTERVAL '6 days') AND %s::date
+                WHERE estado_s = 'finalizado' AND fecha_s BETWEEN %s AND %s
                 GROUP BY metodo_pago;
-            """, (today_co, today_co))
+            """, (today_co - timedelta(days=6), today_co))
             stats_semana = procesar_resultados(cur.fetchall())
 
             # Estadística del Mes (basado en el mes y año de la fecha de Colombia)
             cur.execute("""
                 SELECT metodo_pago, SUM(monto_pago) as total
                 FROM servicio
-                WHERE estado_s = 'finalizado' AND date_trunc('month', fecha_s) = date_trunc('month', %s::date)
+                WHERE estado_s = 'finalizado' AND fecha_s >= %s AND fecha_s < %s
                 GROUP BY metodo_pago;
-            """, (today_co,))
+            """, (inicio_de_mes(today_co), inicio_de_mes(today_co, 1)))
             stats_mes = procesar_resultados(cur.fetchall())
 
             return jsonify({
@@ -354,11 +560,11 @@ def get_estadisticas():
                 "mes": stats_mes
             })
 
+    try:
+        return run_read_query(consultar)
     except Exception as e:
         app.logger.error(f"API_GET_ESTADISTICAS_ERROR: {e}")
         return jsonify({"error": "Error interno al obtener las estadísticas", "detalle": str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 # --- Lógica del Chatbot de WhatsApp ---
 AVAILABLE_SERVICES = [
@@ -371,12 +577,12 @@ AVAILABLE_SERVICES = [
 def get_session(sender_id):
     conn = get_db_connection()
     try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        with dict_cursor(conn) as cur:
             cur.execute("SELECT session_data FROM whatsapp_sessions WHERE sender_id = %s;", (sender_id,))
             result = cur.fetchone()
             return result['session_data'] if result else None
     finally:
-        if conn: conn.close()
+        release_connection(conn)
 
 def save_session(sender_id, session):
     conn = get_db_connection()
@@ -388,7 +594,7 @@ def save_session(sender_id, session):
             ''', (sender_id, json.dumps(session)))
             conn.commit()
     finally:
-        if conn: conn.close()
+        release_connection(conn)
 
 def delete_session(sender_id):
     conn = get_db_connection()
@@ -397,13 +603,13 @@ def delete_session(sender_id):
             cur.execute("DELETE FROM whatsapp_sessions WHERE sender_id = %s;", (sender_id,))
             conn.commit()
     finally:
-        if conn: conn.close()
+        release_connection(conn)
 
 def save_service_request(sender_id, data):
     conn = get_db_connection()
     try:
-        colombia_tz = pytz.timezone('America/Bogota')
-        now_in_colombia = datetime.now(colombia_tz)
+        now_in_colombia = datetime.now(colombia_tz())
+        ensure_month_partition(conn, now_in_colombia.date())
         current_date = now_in_colombia.strftime('%Y-%m-%d')
         current_time = now_in_colombia.strftime('%H:%M:%S')
 
@@ -439,7 +645,7 @@ def save_service_request(sender_id, data):
         if conn: conn.rollback()
         raise
     finally:
-        if conn: conn.close()
+        release_connection(conn)
 
 def get_summary_message(data):
     return (
@@ -463,8 +669,7 @@ def whatsapp_reply():
     sender_id = request.values.get('From', '')
     message_body = request.values.get('Body', '').strip()
     message_body_lower = message_body.lower()
-    resp = MessagingResponse()
-    msg = resp.message()
+    msg = MessagingReply()
 
     session = get_session(sender_id)
 
@@ -472,12 +677,12 @@ def whatsapp_reply():
         session = {'state': 'AWAITING_NAME', 'data': {}}
         msg.body("¡Bienvenido al servicio de cerrajería! Para comenzar, por favor, dime tu nombre completo.")
         save_session(sender_id, session)
-        return str(resp)
+        return str(msg)
     
     if message_body_lower == 'salir':
         delete_session(sender_id)
         msg.body("Tu solicitud ha sido cancelada. Si quieres empezar de nuevo, solo escribe 'hola'.")
-        return str(resp)
+        return str(msg)
 
     state = session.get('state', 'AWAITING_NAME')
     data = session.get('data', {})
@@ -518,7 +723,7 @@ def whatsapp_reply():
                 save_service_request(sender_id, data)
                 msg.body("¡Servicio confirmado! Tu solicitud ha sido guardada. Pronto un cerrajero se pondrá en contacto contigo.")
                 delete_session(sender_id)
-                return str(resp) 
+                return str(msg) 
             except Exception as e:
                 app.logger.error(f"SAVE_REQUEST_FAILED: {e}")
                 msg.body("Lo siento, hubo un error técnico al guardar tu solicitud. Por favor, intenta de nuevo escribiendo *confirmar*.")
@@ -581,7 +786,9 @@ def whatsapp_reply():
 
     session['data'] = data
     save_session(sender_id, session)
-    return str(resp)
+    return str(msg)
+
+app.logger.info(f"STARTUP_IMPORT: main.py listo en {(time.perf_counter() - _STARTUP_T0) * 1000:.1f} ms")
 
 # --- Punto de Entrada de la Aplicación ---
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+import os
+import sys
+import psycopg2
+from datetime import date
+from dotenv import load_dotenv
+
+# --- Particionamiento Mensual de `servicio` e `historial_estado` ---
+# Uso:
+#   python particiones.py migrar                      -> convierte las tablas actuales (en el mismo lugar)
+#   python particiones.py crear --meses 3             -> crea por adelantado las particiones de los próximos meses
+#   python particiones.py archivar --retener 12       -> separa (DETACH) los meses cerrados más antiguos
+#   python particiones.py archivar --exportar ./archivo -> exporta a CSV y elimina los meses cerrados
+
+TABLAS_PARTICIONADAS = ('servicio', 'historial_estado')
+
+# Función en la base de datos que crea las particiones de un mes (y de los siguientes).
+# Se usa desde la app antes de insertar, así los meses nuevos se crean solos.
+# Los meses archivados quedan registrados en particion_archivada y nunca se vuelven a crear,
+# tanto si se separaron (DETACH) como si se exportaron y eliminaron.
+FUNCION_CREAR_PARTICIONES = """
+CREATE TABLE IF NOT EXISTS particion_archivada (
+    tabla TEXT NOT NULL,
+    mes DATE NOT NULL,
+    modo VARCHAR(10) NOT NULL CHECK (modo IN ('detach', 'exportar')),
+    destino TEXT,
+    archivada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tabla, mes)
+);
+
+CREATE OR REPLACE FUNCTION crear_particiones_mes(p_fecha DATE, p_meses_adelante INT DEFAULT 1)
+RETURNS VOID AS $$
+DECLARE
+    i INT;
+    inicio DATE;
+    fin DATE;
+    padre TEXT;
+    particion TEXT;
+BEGIN
+    -- Evita que dos procesos intenten crear la misma partición al mismo tiempo
+    PERFORM pg_advisory_xact_lock(hashtext('crear_particiones_mes'));
+    FOR i IN 0..p_meses_adelante LOOP
+        inicio := (date_trunc('month', p_fecha) + make_interval(months => i))::date;
+        fin := (inicio + INTERVAL '1 month')::date;
+        FOREACH padre IN ARRAY ARRAY['servicio', 'historial_estado'] LOOP
+            particion := padre || '_' || to_char(inicio, 'YYYY_MM');
+            IF EXISTS (SELECT 1 FROM particion_archivada a WHERE a.tabla = padre AND a.mes = inicio) THEN
+                RAISE EXCEPTION 'El mes % de % está archivado y no admite nuevos registros', to_char(inicio, 'YYYY-MM'), padre;
+            ELSIF to_regclass(particion) IS NULL THEN
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               particion, padre, inicio, fin);
+            ELSIF NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(particion)) THEN
+                RAISE EXCEPTION 'El mes % de % está archivado y no admite nuevos registros', to_char(inicio, 'YYYY-MM'), padre;
+            END IF;
+        END LOOP;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+# --- Helpers ---
+def get_db_connection():
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        raise ConnectionError("La variable de entorno DATABASE_URL no está configurada.")
+    return psycopg2.connect(db_url, sslmode=os.environ.get("DB_SSLMODE", "require"))
+
+def inicio_de_mes(fecha, meses=0):
+    """Devuelve el primer día del mes de `fecha`, desplazado `meses` meses."""
+    indice = fecha.year * 12 + (fecha.month - 1) + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+def es_particionada(cur, tabla):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (tabla,))
+    row = cur.fetchone()
+    return row is not None and row[0] == 'p'
+
+def crear_particiones(cur, desde, meses_adelante):
+    cur.execute(FUNCION_CREAR_PARTICIONES)
+    cur.execute("SELECT crear_particiones_mes(%s, %s);", (desde, meses_adelante))
+
+def meses_entre(desde, hasta):
+    """Cantidad de meses completos entre el mes de `desde` y el de `hasta`."""
+    return (hasta.year - desde.year) * 12 + (hasta.month - desde.month)
+
+
+# --- Migración en el mismo lugar ---
+def _renombrar_legacy(cur, tabla, columna_id):
+    """Renombra la tabla actual a <tabla>_legacy y libera los nombres que la nueva necesita."""
+    legacy = f"{tabla}_legacy"
+    cur.execute(f"ALTER TABLE {tabla} RENAME TO {legacy};")
+
+    # Los índices comparten espacio de nombres en el esquema: la PK vieja debe cambiar de nombre
+    cur.execute("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('p', 'u');
+    """, (legacy,))
+    for (conname,) in cur.fetchall():
+        cur.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT "{conname}" TO "{conname}_legacy";')
+
+    # La secuencia del SERIAL pasa a la tabla nueva; se suelta para que no se borre con la vieja
+    cur.execute("SELECT pg_get_serial_sequence(%s, %s);", (legacy, columna_id))
+    secuencia = cur.fetchone()[0]
+    if secuencia:
+        cur.execute(f"ALTER SEQUENCE {secuencia} OWNED BY NONE;")
+    return legacy, secuencia
+
+def _claves_foraneas(cur, tabla):
+    cur.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f';
+    """, (tabla,))
+    return cur.fetchall()
+
+def migrar(conn):
+    hoy = date.today()
+    with conn.cursor() as cur:
+        if es_particionada(cur, 'servicio'):
+            print("Las tablas ya están particionadas. No hay nada que migrar.")
+            return
+
+        cur.execute("LOCK TABLE servicio IN ACCESS EXCLUSIVE MODE;")
+        cur.execute("SELECT to_regclass('historial_estado') IS NOT NULL;")
+        tiene_historial = cur.fetchone()[0]
+        if tiene_historial:
+            cur.execute("LOCK TABLE historial_estado IN ACCESS EXCLUSIVE MODE;")
+            # Una tabla particionada no puede ser referenciada por id_servicio solo:
+            # se elimina la FK de historial -> servicio (el borrado en cascada lo hace la app).
+            cur.execute("""
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = 'historial_estado'::regclass AND contype = 'f'
+                  AND confrelid = 'servicio'::regclass;
+            """)
+            for (conname,) in cur.fetchall():
+                cur.execute(f'ALTER TABLE historial_estado DROP CONSTRAINT "{conname}";')
+
+        # 1. Servicio: particionada por RANGE (fecha_s), un mes por partición
+        fks_servicio = _claves_foraneas(cur, 'servicio')
+        legacy, secuencia = _renombrar_legacy(cur, 'servicio', 'id_servicio')
+        cur.execute(f"""
+            CREATE TABLE servicio (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (fecha_s);
+            ALTER TABLE servicio ADD CONSTRAINT pk_servicio PRIMARY KEY (id_servicio, fecha_s);
+            CREATE INDEX idx_servicio_id ON servicio (id_servicio);
+            CREATE INDEX idx_servicio_estado_fecha ON servicio (estado_s, fecha_s);
+        """)
+        for conname, definicion in fks_servicio:
+            cur.execute(f'ALTER TABLE servicio ADD CONSTRAINT "{conname}" {definicion};')
+        if secuencia:
+            cur.execute(f"ALTER SEQUENCE {secuencia} OWNED BY servicio.id_servicio;")
+
+        # Rango de meses con datos: puede haber servicios agendados más allá del mes en curso
+        cur.execute(f"SELECT MIN(fecha_s), MAX(fecha_s) FROM {legacy};")
+        primera, ultima = cur.fetchone()
+        primera, ultima = min(primera or hoy, hoy), max(ultima or hoy, hoy)
+
+        # 2. Historial: particionada por RANGE (fecha_cambio)
+        legacy_historial = None
+        if tiene_historial:
+            fks_historial = _claves_foraneas(cur, 'historial_estado')
+            legacy_historial, secuencia_historial = _renombrar_legacy(cur, 'historial_estado', 'id_historial')
+            cur.execute(f"""
+                UPDATE {legacy_historial} SET fecha_cambio = CURRENT_TIMESTAMP WHERE fecha_cambio IS NULL;
+                CREATE TABLE historial_estado (LIKE {legacy_historial} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (fecha_cambio);
+                ALTER TABLE historial_estado ALTER COLUMN fecha_cambio SET NOT NULL;
+                ALTER TABLE historial_estado ADD CONSTRAINT pk_historial_estado PRIMARY KEY (id_historial, fecha_cambio);
+                CREATE INDEX idx_historial_servicio ON historial_estado (id_servicio);
+            """)
+            for conname, definicion in fks_historial:
+                cur.execute(f'ALTER TABLE historial_estado ADD CONSTRAINT "{conname}" {definicion};')
+            if secuencia_historial:
+                cur.execute(f"ALTER SEQUENCE {secuencia_historial} OWNED BY historial_estado.id_historial;")
+            cur.execute(f"SELECT MIN(fecha_cambio)::date, MAX(fecha_cambio)::date FROM {legacy_historial};")
+            primera_historial, ultima_historial = cur.fetchone()
+            primera = min(primera, primera_historial or hoy)
+            ultima = max(ultima, ultima_historial or hoy)
+        else:
+            crear_historial(cur)
+
+        # 3. Particiones desde el mes más antiguo hasta dos meses después del más reciente
+        crear_particiones(cur, primera, meses_entre(primera, ultima) + 2)
+
+        # 4. Copiar los datos y eliminar las tablas viejas
+        cur.execute(f"INSERT INTO servicio SELECT * FROM {legacy};")
+        print(f"- {cur.rowcount} servicios migrados.")
+        cur.execute(f"DROP TABLE {legacy};")
+        if legacy_historial:
+            cur.execute(f"INSERT INTO historial_estado SELECT * FROM {legacy_historial};")
+            print(f"- {cur.rowcount} registros de historial migrados.")
+            cur.execute(f"DROP TABLE {legacy_historial};")
+
+    conn.commit()
+    print("Migración completada: servicio e historial_estado particionadas por mes.")
+
+def crear_historial(cur):
+    cur.execute("""
+        CREATE TABLE historial_estado (
+            id_historial SERIAL,
+            id_servicio INT NOT NULL,
+            id_cerrajero INT REFERENCES cerrajero (id_cerrajero) ON DELETE SET NULL,
+            estado_anterior VARCHAR(20) NOT NULL,
+            estado_nuevo VARCHAR(20) NOT NULL,
+            fecha_cambio TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            observacion TEXT,
+            CONSTRAINT pk_historial_estado PRIMARY KEY (id_historial, fecha_cambio)
+        ) PARTITION BY RANGE (fecha_cambio);
+        CREATE INDEX idx_historial_servicio ON historial_estado (id_servicio);
+    """)
+
+
+# --- Archivado de Meses Cerrados ---
+def archivar(conn, retener, directorio=None):
+    """Separa (o exporta y elimina) las particiones anteriores a los últimos `retener` meses.
+
+    El mes en curso nunca se archiva. Con `directorio` cada partición se exporta a
+    <directorio>/<particion>.csv y luego se elimina; sin él, solo se separa con DETACH
+    y queda como tabla independiente para consultas históricas. En ambos casos el mes
+    queda en particion_archivada y crear_particiones_mes rechaza nuevos registros en él.
+    """
+    limite = inicio_de_mes(date.today(), -max(retener, 1))
+    archivadas = []
+    with conn.cursor() as cur:
+        # Asegura la tabla de registro y la versión actual de la función
+        cur.execute(FUNCION_CREAR_PARTICIONES)
+        for tabla in TABLAS_PARTICIONADAS:
+            cur.execute("""
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = %s::regclass
+                ORDER BY c.relname;
+            """, (tabla,))
+            for (particion,) in cur.fetchall():
+                anio, mes = particion.rsplit('_', 2)[-2:]
+                inicio = date(int(anio), int(mes), 1)
+                if inicio >= limite:
+                    continue
+
+                cur.execute(f"ALTER TABLE {tabla} DETACH PARTITION {particion};")
+                if directorio:
+                    os.makedirs(directorio, exist_ok=True)
+                    ruta = os.path.join(directorio, f"{particion}.csv")
+                    with open(ruta, 'w', encoding='utf-8') as f:
+                        cur.copy_expert(f"COPY {particion} TO STDOUT WITH CSV HEADER", f)
+                    cur.execute(f"DROP TABLE {particion};")
+                    print(f"- {particion} exportada a {ruta} y eliminada.")
+                else:
+                    ruta = None
+                    print(f"- {particion} separada de {tabla}.")
+                cur.execute("""
+                    INSERT INTO particion_archivada (tabla, mes, modo, destino) VALUES (%s, %s, %s, %s);
+                """, (tabla, inicio, 'exportar' if directorio else 'detach', ruta))
+                archivadas.append(particion)
+    conn.commit()
+    if not archivadas:
+        print(f"No hay meses cerrados anteriores a {limite.strftime('%Y-%m')} para archivar.")
+    return archivadas
+
+
+# --- Punto de Entrada ---
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Particiones mensuales de servicio e historial_estado.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('migrar', help="Convierte las tablas actuales a tablas particionadas por mes.")
+    p_crear = sub.add_parser('crear', help="Crea las particiones del mes actual y los siguientes.")
+    p_crear.add_argument('--meses', type=int, default=3, help="Meses por adelantado (por defecto 3).")
+    p_archivar = sub.add_parser('archivar', help="Archiva los meses cerrados más antiguos.")
+    p_archivar.add_argument('--retener', type=int, default=12,
+                            help="Meses cerrados que se mantienen en línea (por defecto 12).")
+    p_archivar.add_argument('--exportar', metavar='DIRECTORIO',
+                            help="Exporta cada mes a CSV en DIRECTORIO y lo elimina, en vez de solo separarlo.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    conn = get_db_connection()
+    try:
+        if args.comando == 'migrar':
+            migrar(conn)
+        elif args.comando == 'crear':
+            with conn.cursor() as cur:
+                crear_particiones(cur, date.today(), args.meses)
+            conn.commit()
+            print(f"Particiones aseguradas hasta {inicio_de_mes(date.today(), args.meses).strftime('%Y-%m')}.")
+        elif args.comando == 'archivar':
+            archivar(conn, args.retener, args.exportar)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+import threading
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from dotenv import load_dotenv
+
+# --- Réplica de Lectura (opcional) ---
+# Si READ_REPLICA_URL está configurada, las rutas GET del dashboard leen de la réplica
+# mediante un pool propio. Se vuelve al primario cuando la réplica no responde, cuando su
+# retraso supera REPLICA_MAX_LAG_SECONDS o cuando el navegador acaba de escribir.
+
+load_dotenv()
+
+REPLICA_URL = os.environ.get("READ_REPLICA_URL")
+MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "10"))
+CHECK_INTERVAL_SECONDS = float(os.environ.get("REPLICA_CHECK_INTERVAL_SECONDS", "5"))
+# Por defecto, tantas conexiones como peticiones simultáneas atiende el worker (DB_POOL_MAX)
+POOL_MAX = int(os.environ.get("REPLICA_POOL_MAX", os.environ.get("DB_POOL_MAX", "10")))
+DB_SSLMODE = os.environ.get("DB_SSLMODE", "require")
+# Una réplica inalcanzable (que descarta paquetes) no debe bloquear la petición hasta el timeout
+# de TCP del sistema: la conexión y cada consulta tienen un límite, y al vencer se usa el primario.
+CONNECT_TIMEOUT_SECONDS = int(os.environ.get("REPLICA_CONNECT_TIMEOUT_SECONDS", "2"))
+STATEMENT_TIMEOUT_SECONDS = float(os.environ.get("REPLICA_STATEMENT_TIMEOUT_SECONDS", "10"))
+
+# Cookie con el instante (epoch) de la última escritura del navegador
+COOKIE_ULTIMA_ESCRITURA = "ultima_escritura"
+# Entre dos revisiones la réplica puede atrasarse hasta MAX_LAG + CHECK_INTERVAL segundos;
+# durante ese tiempo tras una escritura, el navegador lee del primario.
+VENTANA_LECTURA_PROPIA = MAX_LAG_SECONDS + CHECK_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_lock = threading.Lock()
+_estado = {'sana': True, 'revisada': 0.0}
+
+
+class ReplicaConnection(psycopg2.extensions.connection):
+    """Conexión que pertenece al pool de la réplica (para devolverla al pool y no cerrarla)."""
+
+
+class ReusingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """Pool que no abre conexiones al crearse pero conserva hasta `maxconn` conexiones libres.
+
+    ThreadedConnectionPool solo guarda las conexiones devueltas mientras haya menos de
+    `minconn`; con minconn=0 cerraría todas. Se crea con 0 y luego se sube `minconn`.
+    """
+
+    def __init__(self, maxconn, *args, **kwargs):
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = maxconn
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ReusingConnectionPool(
+                    POOL_MAX, REPLICA_URL, sslmode=DB_SSLMODE,
+                    connect_timeout=CONNECT_TIMEOUT_SECONDS,
+                    options=f"-c statement_timeout={int(STATEMENT_TIMEOUT_SECONDS * 1000)}",
+                    connection_factory=ReplicaConnection,
+                )
+    return _pool
+
+def _marcar(sana):
+    _estado['sana'] = sana
+    _estado['revisada'] = time.monotonic()
+
+def _retraso_segundos(conn):
+    with conn.cursor() as cur:
+        # Solo se da por al día si el receptor de WAL está conectado (streaming) y todo lo
+        # recibido ya se aplicó. Si está desconectado, o el rol no puede ver su estado (requiere
+        # pg_read_all_stats), se mide contra la última transacción aplicada.
+        cur.execute("""
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                     AND (SELECT status FROM pg_stat_wal_receiver) = 'streaming' THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8,
+                              'Infinity'::float8)
+            END;
+        """)
+        retraso = float(cur.fetchone()[0])
+    conn.rollback()
+    return retraso
+
+def escritura_reciente(valor_cookie):
+    """True si el navegador escribió hace menos de VENTANA_LECTURA_PROPIA (debe leer del primario).
+
+    La réplica se usa mientras su retraso medido no supera MAX_LAG_SECONDS, y el retraso
+    se vuelve a medir cada CHECK_INTERVAL_SECONDS: una escritura más antigua que la suma
+    de ambos ya está visible en ella.
+    """
+    try:
+        return time.time() - float(valor_cookie) < VENTANA_LECTURA_PROPIA
+    except (TypeError, ValueError):
+        return False
+
+def get_connection():
+    """Devuelve una conexión a la réplica, o None si no está configurada, caída o atrasada."""
+    if not REPLICA_URL:
+        return None
+
+    revisar = time.monotonic() - _estado['revisada'] >= CHECK_INTERVAL_SECONDS
+    if not _estado['sana'] and not revisar:
+        return None
+
+    conn = None
+    try:
+        conn = _get_pool().getconn()
+        if revisar:
+            retraso = _retraso_segundos(conn)
+            _marcar(retraso <= MAX_LAG_SECONDS)
+            if not _estado['sana']:
+                logger.warning(f"REPLICA_LAG: {retraso:.1f}s supera el límite de {MAX_LAG_SECONDS}s, se usa el primario")
+                release(conn)
+                return None
+        return conn
+    except psycopg2.pool.PoolError:
+        # Pool lleno: la réplica está sana, solo esta petición va al primario
+        logger.info("REPLICA_POOL_EXHAUSTED: se usa el primario para esta lectura")
+        return None
+    except psycopg2.Error as e:
+        logger.warning(f"REPLICA_UNAVAILABLE: {e}")
+        _marcar(False)
+        if conn is not None:
+            _get_pool().putconn(conn, close=True)
+        return None
+
+def release(conn):
+    """Devuelve al pool una conexión de la réplica."""
+    if not conn.closed:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed:
+        # La conexión se rompió durante la consulta: se descarta y se revisa la réplica
+        _marcar(False)
+    _get_pool().putconn(conn, close=bool(conn.closed))
+
+def reset():
+    """Olvida el pool heredado tras un fork y fuerza una nueva revisión de la réplica."""
+    global _pool
+    _pool = None
+    _estado['sana'] = True
+    _estado['revisada'] = 0.0
+
+def close():
+    if _pool is not None:
+        _pool.closeall()
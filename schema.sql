@@ -23,9 +23,9 @@ CREATE TABLE cerrajero (
     CONSTRAINT uq1_cerrajero UNIQUE (telefono_ce)
 );
 
--- TABLA SERVICIO
+-- TABLA SERVICIO (particionada por mes; ver particiones.py)
 CREATE TABLE servicio (
-    id_servicio SERIAL CONSTRAINT pk_servicio PRIMARY KEY,
+    id_servicio SERIAL,
     fecha_s DATE NOT NULL,
     hora_s TIME NOT NULL,
     tipo_s VARCHAR(100) NOT NULL,
@@ -42,18 +42,24 @@ CREATE TABLE servicio (
     CONSTRAINT fk1_servicio FOREIGN KEY (id_cliente) 
         REFERENCES cliente (id_cliente) ON DELETE CASCADE,
     CONSTRAINT fk2_servicio FOREIGN KEY (id_cerrajero) 
-        REFERENCES cerrajero (id_cerrajero) ON DELETE RESTRICT
-);
+        REFERENCES cerrajero (id_cerrajero) ON DELETE RESTRICT,
+    CONSTRAINT pk_servicio PRIMARY KEY (id_servicio, fecha_s)
+) PARTITION BY RANGE (fecha_s);
+
+-- Cada mes es una partición: servicio_AAAA_MM
+-- CREATE TABLE servicio_2025_01 PARTITION OF servicio FOR VALUES FROM ('2025-01-01') TO ('2025-02-01');
 
--- TABLA HISTORIAL DE ESTADOS
+-- TABLA HISTORIAL DE ESTADOS (particionada por mes; ver particiones.py)
+-- id_servicio no tiene FK: una tabla particionada solo puede referenciarse por su PK
+-- completa (id_servicio, fecha_s). El borrado en cascada lo hace la aplicación.
 CREATE TABLE historial_estado (
-    id_historial SERIAL PRIMARY KEY,
-    id_servicio INT NOT NULL 
-        REFERENCES servicio (id_servicio) ON DELETE CASCADE,
+    id_historial SERIAL,
+    id_servicio INT NOT NULL,
     id_cerrajero INT 
         REFERENCES cerrajero (id_cerrajero) ON DELETE SET NULL,
     estado_anterior VARCHAR(20) NOT NULL,
     estado_nuevo VARCHAR(20) NOT NULL,
-    fecha_cambio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    observacion TEXT
-);
\ No newline at end of file
+    fecha_cambio TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    observacion TEXT,
+    PRIMARY KEY (id_historial, fecha_cambio)
+) PARTITION BY RANGE (fecha_cambio);
\ No newline at end of file
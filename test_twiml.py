@@ -0,0 +1,35 @@
+import pytest
+from twilio.twiml.messaging_response import MessagingResponse
+
+from twiml import MessagingReply
+
+# twiml.py reemplaza a MessagingResponse en el webhook: el XML debe ser idéntico byte a byte
+
+CASOS = [
+    (),
+    ("",),
+    ("Hola 👋, ¿en qué te ayudamos?",),
+    ("Escribe *confirmar* & <listo> > \"ok\" 'sí'",),
+    ("línea 1\r\nlínea 2\nlínea 3\r",),
+    ("primero", "", "tercero & último"),
+]
+
+
+def twilio_xml(bodies):
+    resp = MessagingResponse()
+    msg = resp.message()
+    for body in bodies:
+        msg.body(body)
+    return str(resp)
+
+
+def reply_xml(bodies):
+    msg = MessagingReply()
+    for body in bodies:
+        msg.body(body)
+    return str(msg)
+
+
+@pytest.mark.parametrize("bodies", CASOS)
+def test_mismo_xml_que_messaging_response(bodies):
+    assert reply_xml(bodies) == twilio_xml(bodies)
@@ -0,0 +1,30 @@
+# --- TwiML mínimo para las respuestas del chatbot ---
+# Produce exactamente el mismo XML que twilio.twiml.messaging_response.MessagingResponse
+# con un solo <Message>, sin importar el SDK de Twilio ni construir el árbol de elementos.
+
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+
+def escape_text(text):
+    """Escapa el texto de un elemento igual que xml.etree.ElementTree."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def message_response(*bodies):
+    """Devuelve el TwiML de un <Message> con un <Body> por cada texto."""
+    if not bodies:
+        return f'{_XML_DECLARATION}<Response><Message /></Response>'
+    inner = ''.join(f'<Body>{escape_text(b)}</Body>' if b else '<Body />' for b in bodies)
+    return f'{_XML_DECLARATION}<Response><Message>{inner}</Message></Response>'
+
+
+class MessagingReply:
+    """Reemplazo de `MessagingResponse().message()`: acumula los textos con `body()` y `str()` da el XML."""
+
+    def __init__(self):
+        self._bodies = []
+
+    def body(self, text):
+        self._bodies.append(text)
+        return self
+
+    def __str__(self):
+        return message_response(*self._bodies)
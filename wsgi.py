@@ -0,0 +1,69 @@
+import os
+import time
+import logging
+from datetime import datetime
+
+import main
+import replica
+from main import app
+
+# --- Punto de Entrada de Producción ---
+# gunicorn -c gunicorn.conf.py wsgi:app
+# Los hooks de gunicorn.conf.py llaman a estas funciones en cada worker.
+
+WARMUP_CONNECTIONS = int(os.environ.get("WARMUP_CONNECTIONS", "2"))
+TEMPLATES = ('login.html', 'inicio.html', 'servicios.html', 'agregar.html', 'estadisticas.html', 'clave.html')
+
+logger = logging.getLogger(__name__)
+
+
+def reset_after_fork():
+    """Se llama en el worker recién creado: no debe usar conexiones abiertas por el master."""
+    main.reset_startup_timer()
+    main.reset_db_pools()
+    main._particiones_aseguradas.clear()
+
+def make_psycopg2_cooperative():
+    """Con workers gevent, hace que psycopg2 ceda el control mientras espera a Postgres."""
+    import psycopg2.extensions
+    import psycopg2.extras
+    psycopg2.extensions.set_wait_callback(psycopg2.extras.wait_select)
+
+def warmup():
+    """Abre conexiones y precarga cachés antes de que el worker empiece a recibir tráfico.
+
+    Si la base no responde, el worker arranca igual y las conexiones se abren con la
+    primera petición.
+    """
+    t0 = time.perf_counter()
+
+    # Cachés y módulos que se cargan de forma diferida en main.py
+    today_co = datetime.now(main.colombia_tz()).date()
+    import psycopg2.extras  # noqa: F401
+    for template in TEMPLATES:
+        app.jinja_env.get_template(template)
+
+    conns = []
+    try:
+        for _ in range(min(WARMUP_CONNECTIONS, main.DB_POOL_MAX)):
+            conns.append(main.get_db_connection())
+        if conns:
+            main.ensure_month_partition(conns[0], today_co)
+    except Exception as e:
+        logger.warning(f"WARMUP_DB_ERROR: {e}")
+    finally:
+        for conn in conns:
+            main.release_connection(conn)
+
+    # Revisa la réplica (si hay) para que la primera lectura no pague la comprobación
+    conn = replica.get_connection()
+    if conn is not None:
+        replica.release(conn)
+
+    logger.info(f"WARMUP: worker {os.getpid()} listo en {(time.perf_counter() - t0) * 1000:.1f} ms "
+                f"({len(conns)} conexiones abiertas)")
+
+def shutdown():
+    """Al salir el worker (gunicorn ya esperó las peticiones en curso), cierra las conexiones."""
+    main.close_db_pools()
+    logger.info(f"SHUTDOWN: worker {os.getpid()} cerró sus conexiones")